@@ -1,3 +1,23 @@
+import os
+
+# preload the parser and plotting stacks in a background thread when the server starts
+WARM_UP = os.environ.get('PASER_WARM_UP', '0') == '1'
+WARM_UP_MODULES = ['serenipy.dtaselectfilter', 'matplotlib_venn', 'plotly.express', 'scipy.stats']
+
+# byte budget of the parsed file cache shared by all sessions in the server process
+SHARED_CACHE_BYTES = int(os.environ.get('PASER_CACHE_BYTES', 2 * 1024 ** 3))
+# the shared cache entries can only be listed and cleared on the admin page with this password; unset disables both
+ADMIN_PASSWORD = os.environ.get('PASER_ADMIN_PASSWORD')
+
+# filter files may be uploaded as is, gzip/bzip2 compressed, or as zip archives holding many filter files
+UPLOAD_TYPES = ['.txt', '.gz', '.bz2', '.zip']
+# threads reading uploaded files in a run. the parser is pure python and holds the GIL, so workers only overlap
+# decompression and hashing with parsing and let each file finish on its own; parsing itself is not parallel
+PARSE_WORKERS = int(os.environ.get('PASER_PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# number of rows of large frames shown on the pages, the full frames are available as downloads
+PREVIEW_ROWS = 1000
+
 PASER_PLOT_HELP_MSG = '''   
    
     **Peptide Uniqueness**
@@ -41,7 +61,7 @@ PASER_PLOT_HELP_MSG = '''
 
 PASER_VENN_HELP_MSG = '''
     
-    Upload 2-3 DTASelect-filter.txt files.
+    Upload 2-3 DTASelect-filter.txt files, as is, compressed (.gz, .bz2) or together in a .zip archive.
 
     Protein Counts - number of unique protein locus's
 
@@ -0,0 +1,101 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import config
+
+_current = threading.local()
+
+
+class Cancelled(Exception):
+    pass
+
+
+def checkpoint():
+    # called by long stages between files, stops the stage as soon as its job is cancelled; a no-op outside a job
+    job = getattr(_current, 'job', None)
+    if job is not None and job._cancelled.is_set():
+        raise Cancelled()
+
+
+class Job:
+    # runs parse -> stages in a background thread; the page polls its progress and can cancel it at any time.
+    # parse is called on every file in a worker thread, its results are the parsed files passed to the stages
+
+    def __init__(self, files, stages, data, parse):
+        self.files = files
+        self.stages = ['parse'] + [name for name, _ in stages]
+        self.stage = 'parse'
+        self.stages_done = 0
+        self.parsed_files = [None] * len(files)
+        self.files_done = 0
+        self.state = 'running'
+        self.error = None
+        self.data = data
+        self._stage_fns = stages
+        self._parse_fn = parse
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='paser-job', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self.state == 'running'
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.running:
+            self.state = 'cancelled'
+        self._release()
+
+    def _release(self):
+        # clearing the shared dict drops the frames and outputs even while a stage still holds it
+        self.parsed_files = [None] * len(self.files)
+        if self.data is not None:
+            self.data.clear()
+        self.data = None
+
+    def _parse(self):
+        executor = ThreadPoolExecutor(max_workers=config.PARSE_WORKERS)
+        futures = {executor.submit(self._parse_fn, file): i for i, file in enumerate(self.files)}
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                if self._cancelled.is_set():
+                    return False
+                for future in done:
+                    self.parsed_files[futures[future]] = future.result()
+                    self.files_done += 1
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return True
+
+    def _run(self):
+        _current.job = self
+        data = self.data
+        try:
+            if not self._parse():
+                return
+            data['parsed_files'] = self.parsed_files
+            self.stages_done += 1
+
+            for name, stage_fn in self._stage_fns:
+                if self._cancelled.is_set():
+                    return
+                self.stage = name
+                stage_fn(data)
+                self.stages_done += 1
+
+            if not self._cancelled.is_set():
+                self.state = 'done'
+        except Cancelled:
+            pass
+        except Exception as e:
+            if not self._cancelled.is_set():
+                self.error = e
+                self.state = 'failed'
+                self._release()
+        finally:
+            _current.job = None
+            if self._cancelled.is_set():
+                self._release()
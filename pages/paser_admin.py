@@ -0,0 +1,42 @@
+import streamlit as st
+
+import config
+import shared_cache
+import util
+
+util.warm_up()
+
+st.header('PaSER Admin! :gear:')
+
+st.write("""
+This page shows the parsed file cache shared by all sessions on this server.
+""")
+
+stats = shared_cache.CACHE.stats()
+
+c1, c2, c3, c4 = st.columns(4)
+c1.metric(label='Memory', value=f'{stats["bytes"] / 1024 ** 2:.1f} MB',
+          help=f'Budget: {stats["max_bytes"] / 1024 ** 2:.1f} MB')
+c2.metric(label='Hits', value=stats['hits'])
+c3.metric(label='Misses', value=stats['misses'])
+c4.metric(label='Evictions', value=stats['evictions'])
+
+st.subheader(f'Entries ({stats["entries"]})')
+# entries name other sessions' uploads, so they are only listed, and the cache only cleared, with the password
+if not config.ADMIN_PASSWORD:
+    st.caption('Set PASER_ADMIN_PASSWORD to list the cache entries and allow clearing the cache.')
+else:
+    password = st.text_input(label='Admin password', type='password')
+    if password != config.ADMIN_PASSWORD:
+        if password:
+            st.warning('Incorrect password!')
+    else:
+        entries = shared_cache.CACHE.entries()
+        if entries:
+            st.table(entries)
+
+        if st.button('Clear cache'):
+            shared_cache.CACHE.clear()
+            st.experimental_rerun()
+
+util.timing_report()
@@ -1,11 +1,41 @@
-from io import StringIO
-
 import streamlit as st
-from serenipy.dtaselectfilter import results_from_df, to_dta_select_filter, DtaSelectFilterVersion, \
-    from_dta_select_filter
 
+import config
+import jobs
+import set_logic
 import util
 
+util.warm_up()
+
+
+def get_diff_outputs(result):
+    # downloads and previews are built once here, so reruns of the page only re-send them
+    dtaselectfilter = util.lazy_import('serenipy.dtaselectfilter')
+    util.add_combined_outputs(result)
+    labels = result['labels']
+
+    for name, outputs_name, suffix in [('differences', 'difference_outputs', 'diff'),
+                                       ('intersections', 'intersection_outputs', 'inter')]:
+        outputs = []
+        for i, (rows, parsed_file) in enumerate(zip(result[name], result['parsed_files'])):
+            jobs.checkpoint()
+            df_diff = util.get_keyed_frame(result['parsed_files'], result['peptide_keys'], result['protein_keys'], i,
+                                           rows)
+            results = dtaselectfilter.results_from_df(df_diff)
+            results.sort(key=lambda x: x.protein_lines[0].sequence_coverage, reverse=True)
+            filter_content = dtaselectfilter.to_dta_select_filter(version=parsed_file['version'],
+                                                                  h_lines=parsed_file['header'],
+                                                                  dta_filter_results=results,
+                                                                  end_lines=parsed_file['tailer'])
+            outputs.append({'head': df_diff.head(config.PREVIEW_ROWS),
+                            'rows': len(df_diff),
+                            'filter_link': util.create_download_link(filter_content.encode('UTF-8'),
+                                                                     f'{labels[i]}_{suffix}.txt'),
+                            'csv_link': util.create_download_link(df_diff.to_csv(index=False).encode('UTF-8'),
+                                                                  f'{labels[i]}_{suffix}.csv')})
+        result[outputs_name] = outputs
+
+
 st.header('PaSER Diff! :bar_chart:')
 
 st.write("""
@@ -13,8 +43,8 @@ This app is used to extract unique identifications from uploaded experiments. A
 for each experiment, which will contain only peptides that were uniquely identified within that experiment, and no others. The Charge, modification, and protein
 group options are used for set logic, and all charge/modifications will be included in the results files.""")
 
-files = st.file_uploader(label='DTASelect-filter.txt files', accept_multiple_files=True, type='.txt')
-use_charge, use_modifications, use_groups = util.peptide_config()
+files = util.get_uploaded_files()
+use_charge, use_modifications, use_groups, use_stable_keys = util.peptide_config()
 group_by_peptide = st.checkbox(label='Group by peptide', value=True)
 
 with st.expander('Custom Order'):
@@ -32,71 +62,29 @@ if st.button('Run'):
 
     orders, labels, files = zip(*sorted(zip(orders, labels, files)))
 
-    versions, headers, results, tailers  = [], [], [], []
-    for file in files:
-        file_io = StringIO(file.getvalue().decode("utf-8"))
-        version, header, dta_select_filter_results, tailer = from_dta_select_filter(file_io)
-        versions.append(version)
-        headers.append(header)
-        results.append(dta_select_filter_results)
-        tailers.append(tailer)
+    util.start_job('diff_job', files, labels,
+                   util.pipeline_stages(use_charge, use_modifications, use_groups, use_stable_keys) +
+                   [('set logic', lambda result: set_logic.get_diff_sets(result, group_by_peptide)),
+                    ('outputs', get_diff_outputs)])
 
-    df = util.get_peptides_and_protein_df(results)
-    util.add_protein_groups(df, use_groups)
-    util.add_peptide_groups(df, use_charge, use_modifications)
+result = util.get_job_result('diff_job')
+if result is not None:
+    labels, files = result['labels'], result['files']
+    util.store_search_index(result['parsed_files'], labels)
 
     with st.expander('Data'):
-        st.dataframe(df)
-        st.markdown(util.create_download_link(df.to_csv(index=False).encode('UTF-8'), f'combined.csv'),
-                    unsafe_allow_html=True)
-
-    protein_key_to_file_nums = {}
-    peptide_key_to_file_nums = {}
-    for protein_key, peptide_key, file_num in df[['protein_key', 'peptide_key', 'file_num']].values:
-        protein_key_to_file_nums.setdefault(protein_key, set()).add(file_num)
-        peptide_key_to_file_nums.setdefault(peptide_key, set()).add(file_num)
-
-    KEY = 'peptide_key' if group_by_peptide is True else 'protein_key'
-
-    st.header('Difference')
-    for i in range(len(files)):
-        st.subheader(labels[i])
-
-        if group_by_peptide is True:
-            df_diff = df[[len(peptide_key_to_file_nums[key]) == 1 and i in peptide_key_to_file_nums[key] for key in df['peptide_key']]]
-        else:
-            df_diff = df[[len(protein_key_to_file_nums[key]) == 1 and i in protein_key_to_file_nums[key] for key in df['protein_key']]]
-        df_diff = df_diff[df_diff['file_num']==i]
-
-        results = results_from_df(df_diff)
-        results.sort(key=lambda x: x.protein_lines[0].sequence_coverage, reverse=True)
-        filter_content = to_dta_select_filter(version=versions[i], h_lines=headers[i],
-                                              dta_filter_results=results, end_lines=tailers[i])
-        with st.expander(f'{labels[i]} dataframe'):
-            st.dataframe(df_diff)
-        st.markdown(util.create_download_link(filter_content.encode('UTF-8'), f'{labels[i]}_diff.txt'),
-                    unsafe_allow_html=True)
-        st.markdown(util.create_download_link(df_diff.to_csv(index=False).encode('UTF-8'), f'{labels[i]}_diff.csv'),
-                    unsafe_allow_html=True)
-
-    st.header('Intersection')
-    for i in range(len(files)):
-        st.subheader(labels[i])
-        if group_by_peptide is True:
-            df_diff = df[[len(peptide_key_to_file_nums[key]) == len(files) and i in peptide_key_to_file_nums[key] for key in df['peptide_key']]]
-        else:
-            df_diff = df[[len(protein_key_to_file_nums[key]) == len(files) and i in protein_key_to_file_nums[key] for key in df['protein_key']]]
-
-        df_diff = df_diff[df_diff['file_num']==i]
-        results = results_from_df(df_diff)
-        results.sort(key=lambda x: x.protein_lines[0].sequence_coverage, reverse=True)
-        filter_content = to_dta_select_filter(version=versions[i], h_lines=headers[i],
-                                              dta_filter_results=results, end_lines=tailers[i])
-        with st.expander(f'{labels[i]} dataframe'):
-            st.dataframe(df_diff)
-        st.markdown(util.create_download_link(filter_content.encode('UTF-8'), f'{labels[i]}_inter.txt'),
-                    unsafe_allow_html=True)
-        st.markdown(util.create_download_link(df_diff.to_csv(index=False).encode('UTF-8'), f'{labels[i]}_inter.csv'),
-                    unsafe_allow_html=True)
-
-
+        util.show_preview(result['combined_head'], result['combined_rows'])
+        st.markdown(result['combined_link'], unsafe_allow_html=True)
+
+    for header, outputs_name in [('Difference', 'difference_outputs'), ('Intersection', 'intersection_outputs')]:
+        st.header(header)
+        for i in range(len(files)):
+            st.subheader(labels[i])
+            outputs = result[outputs_name][i]
+            with st.expander(f'{labels[i]} dataframe'):
+                util.show_preview(outputs['head'], outputs['rows'])
+            st.markdown(outputs['filter_link'], unsafe_allow_html=True)
+            st.markdown(outputs['csv_link'], unsafe_allow_html=True)
+
+util.peptide_search()
+util.timing_report()
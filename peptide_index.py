@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+INDEX_FIELDS = {'Peptide': 'clean_sequence',
+                'Unmodified Peptide': 'unmod_sequence',
+                'Locus': 'locus_name',
+                'Protein Group': 'protein_group'}
+
+SEARCH_MODES = ('Exact', 'Prefix', 'Substring')
+
+
+def _build_field_index(values):
+    # sorted unique values + row positions grouped by value: rows of values[k] are order[starts[k]:starts[k + 1]]
+    codes, uniques = pd.factorize(values, sort=True)
+    order = np.argsort(codes, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(uniques)))])
+    return {'values': np.asarray(uniques, dtype=object), 'order': order, 'starts': starts}
+
+
+def build_index(df):
+    # built once per parsed file and shared with it, searches run over the indexes of every loaded file
+    return {field: _build_field_index(df[column].astype(str).values) for field, column in INDEX_FIELDS.items()}
+
+
+def _matching_value_ids(field_index, query, mode):
+    values = field_index['values']
+    if mode == 'Exact':
+        lo = np.searchsorted(values, query, side='left')
+        hi = np.searchsorted(values, query, side='right')
+        return np.arange(lo, hi)
+    if mode == 'Prefix':
+        lo = np.searchsorted(values, query, side='left')
+        hi = np.searchsorted(values, query + '\U0010ffff', side='left')
+        return np.arange(lo, hi)
+    if mode == 'Substring':
+        return np.flatnonzero(pd.Series(values).str.contains(query, regex=False).values)
+    raise ValueError(f'Unknown search mode: {mode}')
+
+
+def search(indexes, field, query, mode='Exact', limit=100):
+    # returns one row per matching value: (value, [(file num, row positions), ...]), at most limit values, and the
+    # number of distinct matching values in all files
+    matches = {}
+    values = set()
+    for file_num, index in enumerate(indexes):
+        field_index = index[field]
+        value_ids = _matching_value_ids(field_index, query, mode)
+        values.update(field_index['values'][value_ids])
+        # values are sorted in every file, so the first limit values overall are among the first limit of each file
+        for value_id in value_ids[:limit]:
+            rows = field_index['order'][field_index['starts'][value_id]:field_index['starts'][value_id + 1]]
+            matches.setdefault(field_index['values'][value_id], []).append((file_num, rows))
+    return sorted(matches.items())[:limit], len(values)
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+import jobs
+
+# set logic run by the page jobs on the per-file key arrays
+
+
+def get_key_memberships(key_arrays):
+    # bit i of a key's membership is set when the key is found in file i
+    memberships = pd.concat([pd.Series(1 << i, index=pd.unique(keys)) for i, keys in enumerate(key_arrays)])
+    return memberships.groupby(level=0).sum()
+
+
+def get_file_memberships(key_arrays):
+    # the membership of every row of every file
+    memberships = get_key_memberships(key_arrays)
+    return [memberships.reindex(keys).values for keys in key_arrays]
+
+
+def get_venn_subsets(key_arrays):
+    # region m of the venn diagram holds the keys found in exactly the files whose bits are set in m,
+    # regions are ordered as matplotlib_venn expects: (Ab, aB, AB) or (Abc, aBc, ABc, abC, AbC, aBC, ABC)
+    counts = get_key_memberships(key_arrays).value_counts()
+    return tuple(int(counts.get(mask, 0)) for mask in range(1, 1 << len(key_arrays)))
+
+
+def get_venn_sets(result):
+    result['protein_subsets'] = get_venn_subsets(result['protein_keys'])
+    result['peptide_subsets'] = get_venn_subsets(result['peptide_keys'])
+    result['protein_counts'] = [len(pd.unique(keys)) for keys in result['protein_keys']]
+    result['peptide_counts'] = [len(pd.unique(keys)) for keys in result['peptide_keys']]
+
+
+def get_plot_data(result):
+    labels, files = result['labels'], result['files']
+    datas = []
+    global_proteins = set()
+    global_peptides = set()
+    for i in range(len(files)):
+        jobs.checkpoint()
+        peptides = list(result['peptide_keys'][i])
+        proteins = list(result['protein_keys'][i])
+
+        peptide_set = set(peptides)
+        protein_set = set(proteins)
+
+        data = {'name': labels[i],
+                'order': str(i),
+                'Unique Peptides': len(peptide_set),
+                'Total Peptides': len(peptides),
+                'Duplicate Peptides': len(peptides) - len(peptide_set),
+                'New Unique Peptides': len(peptide_set - global_peptides),
+                'New Peptides': sum([p not in global_peptides for p in peptides]),
+                'Unique New Peptides': sum([p not in global_peptides for p in peptide_set]),
+                'Seen Unique Peptides': len(global_peptides.intersection(peptide_set)),
+                'Seen Peptides': sum([p in global_peptides for p in peptides]),
+                'Unique Seen Peptides': sum([p in global_peptides for p in peptide_set]),
+                'Unique Proteins': len(protein_set),
+                'Duplicate Proteins': len(proteins) - len(protein_set),
+                'Total Proteins': len(proteins),
+                'New Proteins': sum([p not in global_proteins for p in protein_set]),
+                'New Unique Proteins': len(protein_set - global_proteins),
+                'Seen Proteins': sum([p in global_proteins for p in protein_set]),
+                'Seen Unique Proteins': len(global_proteins.intersection(protein_set))}
+
+        data['Unique Peptides Percent'] = round(data['Unique Peptides'] / data['Total Peptides'], 4) * 100
+        data['Duplicate Peptides Percent'] = round(data['Duplicate Peptides'] / data['Total Peptides'], 4) * 100
+        data['New Peptides Percent'] = round(data['New Peptides'] / data['Total Peptides'], 4) * 100
+        data['Seen Peptides Percent'] = round(data['Seen Peptides'] / data['Total Peptides'], 4) * 100
+        data['New Unique Peptides Percent'] = round(data['New Unique Peptides'] / data['Unique Peptides'], 4) * 100
+        data['Seen Unique Peptides Percent'] = round(data['Seen Unique Peptides'] / data['Unique Peptides'], 4) * 100
+        data['New Proteins Percent'] = round(data['New Proteins'] / data['Unique Proteins'], 4) * 100
+        data['Seen Proteins Percent'] = round(data['Seen Proteins'] / data['Unique Proteins'], 4) * 100
+        global_proteins.update(protein_set)
+        global_peptides.update(peptide_set)
+
+        data['Protein Counts'] = len(global_proteins)
+        data['Peptide Counts'] = len(global_peptides)
+
+        datas.append(data)
+
+    result['datas'] = datas
+
+
+def get_diff_sets(result, group_by_peptide):
+    # row positions, per file, of the rows found only in that file and of the rows found in every file
+    files = result['files']
+    key_arrays = result['peptide_keys'] if group_by_peptide is True else result['protein_keys']
+    file_memberships = get_file_memberships(key_arrays)
+
+    result['differences'] = [np.flatnonzero(file_memberships[i] == 1 << i) for i in range(len(files))]
+    result['intersections'] = [np.flatnonzero(file_memberships[i] == (1 << len(files)) - 1)
+                               for i in range(len(files))]
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+class SharedCache:
+    # process-wide LRU cache with a byte budget, shared by every streamlit session in the server
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry['hits'] += 1
+            self.hits += 1
+            return entry['value']
+
+    def put(self, key, value, size, name=None):
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)['size']
+            if size > self.max_bytes:
+                return
+            while self.total_bytes + size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted['size']
+                self.evictions += 1
+            self._entries[key] = {'value': value, 'size': size, 'name': name, 'hits': 0, 'added': time.time()}
+            self.total_bytes += size
+
+    def get_or_compute(self, key, compute, sizeof, name=None):
+        # sessions asking for the same key at the same time wait for a single computation. key locks are counted
+        # by the sessions holding or waiting on them, and dropped by the last one
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, {'lock': threading.Lock(), 'users': 0})
+            key_lock['users'] += 1
+        try:
+            with key_lock['lock']:
+                value = self.get(key)
+                if value is None:
+                    value = compute()
+                    self.put(key, value, sizeof(value), name)
+        finally:
+            with self._lock:
+                key_lock['users'] -= 1
+                if key_lock['users'] == 0:
+                    del self._key_locks[key]
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries),
+                    'bytes': self.total_bytes,
+                    'max_bytes': self.max_bytes,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
+
+    def entries(self):
+        with self._lock:
+            return [{'name': entry['name'], 'key': str(key), 'bytes': entry['size'], 'hits': entry['hits'],
+                     'added': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['added']))}
+                    for key, entry in reversed(self._entries.items())]
+
+
+CACHE = SharedCache(config.SHARED_CACHE_BYTES)
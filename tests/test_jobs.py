@@ -0,0 +1,50 @@
+import threading
+import time
+
+import jobs
+
+
+def _wait_for(condition, timeout=5):
+    start = time.time()
+    while not condition() and time.time() - start < timeout:
+        time.sleep(0.01)
+    assert condition()
+
+
+def _parse(file):
+    return {'df': file}
+
+
+def test_job_runs_stages_in_order():
+
+    def combine(data):
+        data['total'] = sum(parsed_file['df'] for parsed_file in data['parsed_files'])
+
+    job = jobs.Job([1, 2, 3], [('combine', combine)], {}, _parse)
+    _wait_for(lambda: job.state == 'done')
+
+    assert job.files_done == 3
+    assert job.stages_done == 2
+    assert job.data['total'] == 6
+
+
+def test_cancel_stops_a_running_stage_and_frees_its_data():
+    started = threading.Event()
+    files_seen = []
+
+    def slow_stage(data):
+        started.set()
+        for file_num in range(100):
+            jobs.checkpoint()
+            files_seen.append(file_num)
+            time.sleep(0.01)
+
+    data = {'frame': list(range(1000))}
+    job = jobs.Job([1], [('slow', slow_stage)], data, _parse)
+    started.wait(5)
+    job.cancel()
+
+    assert data == {}
+    _wait_for(lambda: not job._thread.is_alive())
+    assert job.state == 'cancelled'
+    assert len(files_seen) < 100
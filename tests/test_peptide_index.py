@@ -0,0 +1,33 @@
+import pandas as pd
+
+import peptide_index
+
+
+def _index(sequences):
+    return peptide_index.build_index(pd.DataFrame({'clean_sequence': sequences,
+                                                   'unmod_sequence': sequences,
+                                                   'locus_name': ['P1'] * len(sequences),
+                                                   'protein_group': ['P1'] * len(sequences)}))
+
+
+def test_search_across_files():
+    indexes = [_index(['PEPTIDE', 'PEPTIDES', 'AAAK', 'PEPTIDE']), _index(['CCCK', 'PEPTIDE'])]
+
+    exact, total = peptide_index.search(indexes, 'Peptide', 'PEPTIDE', 'Exact')
+    assert total == 1
+    assert [value for value, _ in exact] == ['PEPTIDE']
+    assert [(file_num, list(rows)) for file_num, rows in exact[0][1]] == [(0, [0, 3]), (1, [1])]
+
+    prefix, _ = peptide_index.search(indexes, 'Peptide', 'PEPT', 'Prefix')
+    assert [value for value, _ in prefix] == ['PEPTIDE', 'PEPTIDES']
+
+    substring, _ = peptide_index.search(indexes, 'Peptide', 'CK', 'Substring')
+    assert [value for value, _ in substring] == ['CCCK']
+
+
+def test_search_reports_values_beyond_the_limit():
+    indexes = [_index(['AAAK', 'CCCK', 'DDDK']), _index(['CCCK', 'EEEK'])]
+
+    matches, total = peptide_index.search(indexes, 'Peptide', 'K', 'Substring', limit=2)
+    assert [value for value, _ in matches] == ['AAAK', 'CCCK']
+    assert total == 4
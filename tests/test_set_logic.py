@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+import set_logic
+import util
+
+
+class File:
+    def __init__(self, path):
+        self.path = path
+        self.digest = f'test-{path}'
+
+
+def _parsed_files():
+    return [{'df': pd.DataFrame({'sequence': ['K.PEPTIDE.R', 'K.PEPTIDE.R', 'K.AAAK.R'],
+                                 'unmod_sequence': ['PEPTIDE', 'PEPTIDE', 'AAAK'],
+                                 'charge': [2, 3, 2],
+                                 'protein_group': ['P1', 'P1', 'P2'],
+                                 'locus_name': ['P1', 'P1', 'P2']})},
+            {'df': pd.DataFrame({'sequence': ['K.PEPTIDE.R', 'K.CCCK.R'],
+                                 'unmod_sequence': ['PEPTIDE', 'CCCK'],
+                                 'charge': [2, 2],
+                                 'protein_group': ['P1', 'P3'],
+                                 'locus_name': ['P1', 'P3']})}]
+
+
+def _keyed_result(use_stable_keys):
+    files, parsed_files = [File('a.txt'), File('b.txt')], _parsed_files()
+    return {'files': files,
+            'labels': ('a', 'b'),
+            'parsed_files': parsed_files,
+            'peptide_keys': util.get_file_keys(files, parsed_files, util.get_peptide_columns(True, True),
+                                               use_stable_keys),
+            'protein_keys': util.get_file_keys(files, parsed_files, util.get_protein_columns(True),
+                                               use_stable_keys)}
+
+
+def test_stable_keys_are_int64_and_shared_between_files():
+    result = _keyed_result(True)
+    assert all(keys.dtype == 'int64' for keys in result['peptide_keys'] + result['protein_keys'])
+    assert result['peptide_keys'][0][0] == result['peptide_keys'][1][0]
+    assert result['protein_keys'][0][0] == result['protein_keys'][1][0]
+
+    keyed_df = util.get_keyed_frame(result['parsed_files'], result['peptide_keys'], result['protein_keys'], 0)
+    assert keyed_df[['protein_key', 'peptide_key', 'file_num']].values.dtype == 'int64'
+
+
+def test_keyed_frame_of_selected_rows():
+    result = _keyed_result(False)
+    keyed_df = util.get_keyed_frame(result['parsed_files'], result['peptide_keys'], result['protein_keys'], 0)
+    keyed_rows = util.get_keyed_frame(result['parsed_files'], result['peptide_keys'], result['protein_keys'], 0,
+                                      [0, 2])
+
+    pd.testing.assert_frame_equal(keyed_rows, keyed_df.iloc[[0, 2]])
+
+
+def test_key_map_collisions_are_detected():
+    key_map = pd.DataFrame({'sequence': ['PEPTIDE', 'AAAK'], 'key': [1, 1]})
+    with pytest.raises(ValueError):
+        util.check_key_map(key_map, ['sequence'])
+
+
+def test_venn_sets_with_stable_keys():
+    for use_stable_keys in [False, True]:
+        result = _keyed_result(use_stable_keys)
+        set_logic.get_venn_sets(result)
+
+        assert result['peptide_counts'] == [3, 2]
+        assert result['protein_counts'] == [2, 2]
+        assert result['peptide_subsets'] == (2, 1, 1)
+        assert result['protein_subsets'] == (1, 1, 1)
+
+
+def test_diff_sets_with_stable_keys():
+    for use_stable_keys in [False, True]:
+        result = _keyed_result(use_stable_keys)
+        set_logic.get_diff_sets(result, True)
+
+        assert [list(rows) for rows in result['differences']] == [[1, 2], [1]]
+        assert [list(rows) for rows in result['intersections']] == [[0], [0]]
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from shared_cache import SharedCache
+
+
+def test_evicts_least_recently_used_within_budget():
+    cache = SharedCache(100)
+    cache.put('a', 1, 60)
+    cache.put('b', 2, 30)
+    assert cache.get('a') == 1
+    cache.put('c', 3, 30)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == 90
+
+
+def test_entries_larger_than_budget_are_not_cached():
+    cache = SharedCache(100)
+    cache.put('a', 1, 60)
+    cache.put('big', 2, 500)
+
+    assert cache.get('big') is None
+    assert cache.get('a') == 1
+
+
+def test_failed_compute_releases_key_lock():
+    cache = SharedCache(100)
+
+    def compute():
+        raise ValueError('bad file')
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute('a', compute, lambda value: 1)
+    assert cache._key_locks == {}
+    assert cache.get_or_compute('a', lambda: 1, lambda value: 1) == 1
+
+
+def test_sessions_waiting_on_a_key_never_compute_at_the_same_time():
+    cache = SharedCache(100)
+    running, overlaps = [], []
+
+    def compute():
+        running.append(1)
+        overlaps.append(len(running) > 1)
+        time.sleep(0.1)
+        running.pop()
+        # over the budget, so every waiting session computes again
+        return 'big'
+
+    def get():
+        cache.get_or_compute('a', compute, lambda value: 500)
+
+    threads = [threading.Thread(target=get) for _ in range(3)]
+    # the second session waits on the first, the third arrives while the second is computing
+    for thread, delay in zip(threads, [0, 0.02, 0.13]):
+        time.sleep(delay)
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(overlaps) == 3
+    assert not any(overlaps)
+    assert cache._key_locks == {}
@@ -0,0 +1,109 @@
+import bz2
+import gzip
+import io
+import struct
+import zipfile
+import zlib
+
+import pandas as pd
+import pytest
+
+import shared_cache
+import uploads
+import util
+
+
+class File:
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def getvalue(self):
+        return self.data
+
+
+def _zip(members):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, data in members.items():
+            zip_file.writestr(name, data)
+    return archive.getvalue()
+
+
+def test_same_content_gets_same_digest_in_every_format():
+    content = b'Unique\tFileName\nline\n'
+    files = [File('a_DTASelect-filter.txt', content),
+             File('b_DTASelect-filter.txt.gz', gzip.compress(content, mtime=1)),
+             File('c_DTASelect-filter.txt.gz', gzip.compress(content, mtime=2)),
+             File('d_DTASelect-filter.txt.bz2', bz2.compress(content)),
+             File('e.zip', _zip({'run1/DTASelect-filter.txt': content})),
+             File('f.zip', _zip({'other/DTASelect-filter.txt': content, 'notes.md': b'x'}))]
+
+    members = uploads.expand_uploads(files)
+    assert len(members) == 6
+
+    digests = set()
+    for member in members:
+        text, digest = member.read_hashed(lambda file_io: file_io.read())
+        assert text == content.decode('utf-8')
+        digests.add(digest)
+        with member.open() as file_io:
+            assert isinstance(file_io, io.TextIOWrapper)
+    assert len(digests) == 1
+
+
+def test_digest_covers_content_left_unread():
+    member, = uploads.expand_uploads([File('a.txt.gz', gzip.compress(b'Unique\nline\n'))])
+    other, = uploads.expand_uploads([File('b.txt.gz', gzip.compress(b'Unique\nother\n'))])
+
+    assert member.read_hashed(lambda file_io: file_io.readline())[1] != \
+           other.read_hashed(lambda file_io: file_io.readline())[1]
+
+
+def test_zip_member_with_forged_crc_is_rejected():
+    content, forged = b'Unique\nline\n', b'Unique\nlie!\n'
+    archive = _zip({'run1/DTASelect-filter.txt': forged})
+    # the directory claims the crc of other content with the same size
+    archive = archive.replace(struct.pack('<I', zlib.crc32(forged)), struct.pack('<I', zlib.crc32(content)))
+    member, = uploads.expand_uploads([File('runs.zip', archive)])
+
+    with pytest.raises(zipfile.BadZipFile):
+        member.read_hashed(lambda file_io: file_io.readline())
+
+
+def test_zip_members_are_named_by_folder():
+    members = uploads.expand_uploads([File('runs.zip', _zip({'run1/DTASelect-filter.txt': b'1',
+                                                             'run2/DTASelect-filter.txt': b'2'}))])
+
+    assert [member.name for member in members] == ['run1_DTASelect-filter.txt', 'run2_DTASelect-filter.txt']
+    assert [member.path for member in members] == ['runs.zip/run1/DTASelect-filter.txt',
+                                                   'runs.zip/run2/DTASelect-filter.txt']
+    assert members[0].upload_key != members[1].upload_key
+
+
+def test_parse_file_is_keyed_by_content_and_reuploads_are_not_read(monkeypatch):
+    monkeypatch.setattr(shared_cache, 'CACHE', shared_cache.SharedCache(10 ** 6))
+    reads = []
+
+    def parse(file_io):
+        reads.append(file_io.read())
+        return {'df': pd.DataFrame({'line': [reads[-1]]}), 'header': [], 'tailer': [], 'index': {}}
+
+    monkeypatch.setattr(util, '_parse_file', parse)
+    content = b'Unique\nline\n'
+    txt, = uploads.expand_uploads([File('a.txt', content)])
+    gz, = uploads.expand_uploads([File('a.txt.gz', gzip.compress(content))])
+    reupload, = uploads.expand_uploads([File('b.txt.gz', gzip.compress(content))])
+
+    parsed_txt, parsed_gz = util.parse_file(txt), util.parse_file(gz)
+    assert parsed_gz is parsed_txt
+    assert txt.digest == gz.digest
+    assert util.parse_file(reupload) is parsed_txt
+    assert len(reads) == 2
+
+
+def test_zip_members_at_the_root_are_named_by_archive():
+    members = uploads.expand_uploads([File('run1.zip', _zip({'DTASelect-filter.txt': b'1'})),
+                                      File('run2.zip', _zip({'DTASelect-filter.txt': b'2'}))])
+
+    assert [member.name for member in members] == ['run1_DTASelect-filter.txt', 'run2_DTASelect-filter.txt']
@@ -0,0 +1,130 @@
+import bz2
+import gzip
+import hashlib
+import io
+import posixpath
+import threading
+import zipfile
+
+ARCHIVE_MEMBER_SUFFIX = '.txt'
+CHUNK_SIZE = 1024 ** 2
+
+
+class Upload:
+    # the bytes of an uploaded file; their sha256 is computed once, by the first parse worker that needs it
+
+    def __init__(self, data):
+        self.data = data
+        self._digest = None
+        self._lock = threading.Lock()
+
+    def digest(self):
+        with self._lock:
+            if self._digest is None:
+                self._digest = hashlib.sha256(self.data).hexdigest()
+            return self._digest
+
+
+class _HashingReader(io.RawIOBase):
+    # passes a binary stream through, hashing everything read from it
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.hash = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self.hash.update(data)
+        return len(data)
+
+    def close(self):
+        self._stream.close()
+        super().close()
+
+
+class UploadedMember:
+    # a single filter file from an upload; it is decompressed as a text stream without reading it all into memory.
+    # digest is the sha256 of the uncompressed content, it is set once the member has been parsed
+
+    def __init__(self, name, path, upload, member, opener):
+        self.name = name
+        self.path = path
+        self.digest = None
+        self._upload = upload
+        self._member = member
+        self._opener = opener
+
+    @property
+    def upload_key(self):
+        # the same uploaded bytes always hold the same content, so re-uploads can be matched without decompressing
+        return f'upload-sha256-{self._upload.digest()}/{self._member}'
+
+    def open(self):
+        return io.TextIOWrapper(self._opener(), encoding='utf-8')
+
+    def read_hashed(self, read):
+        # returns read(text stream) and the digest of the uncompressed content, hashed in the same pass that feeds read
+        reader = _HashingReader(self._opener())
+        with io.TextIOWrapper(io.BufferedReader(reader, CHUNK_SIZE), encoding='utf-8') as file_io:
+            result = read(file_io)
+            # anything read left unread still counts towards the digest, zip members check their crc at the end
+            while file_io.buffer.read(CHUNK_SIZE):
+                pass
+        return result, get_content_digest(reader.hash)
+
+
+def get_content_digest(content_hash):
+    # digests describe the uncompressed content, so the same filter file gets the same digest whether it was
+    # uploaded as is, compressed or inside any archive
+    return f'sha256-{content_hash.hexdigest()}'
+
+
+def _zip_members(file, upload):
+    with zipfile.ZipFile(io.BytesIO(upload.data)) as archive:
+        infos = [info for info in archive.infolist()
+                 if not info.is_dir()
+                 and info.filename.endswith(ARCHIVE_MEMBER_SUFFIX)
+                 and not posixpath.basename(info.filename).startswith('.')
+                 and not info.filename.startswith('__MACOSX/')]
+
+    members = []
+    for info in infos:
+        # every member opens its own ZipFile so members can be streamed from several threads at once
+        def opener(info=info):
+            return zipfile.ZipFile(io.BytesIO(upload.data)).open(info)
+
+        # folders are folded into the name so that run1/DTASelect-filter.txt is labelled run1, members at the
+        # root of the archive are named after it so that runs.zip/DTASelect-filter.txt is labelled runs
+        folder = posixpath.dirname(info.filename) or file.name.rsplit('.', 1)[0]
+        members.append(UploadedMember(name=f'{folder}/{posixpath.basename(info.filename)}'.replace('/', '_'),
+                                      path=f'{file.name}/{info.filename}',
+                                      upload=upload,
+                                      member=info.filename,
+                                      opener=opener))
+    return members
+
+
+def _opener(file, data):
+    if file.name.endswith('.gz'):
+        return lambda: gzip.GzipFile(fileobj=io.BytesIO(data))
+    if file.name.endswith('.bz2'):
+        return lambda: bz2.BZ2File(io.BytesIO(data))
+    return lambda: io.BytesIO(data)
+
+
+def expand_upload(file):
+    # only reads the upload and the zip directory, decompressing and hashing are left to the parse workers
+    upload = Upload(file.getvalue())
+    if file.name.endswith('.zip'):
+        return _zip_members(file, upload)
+
+    name = file.name.rsplit('.', 1)[0] if file.name.endswith('.gz') or file.name.endswith('.bz2') else file.name
+    return [UploadedMember(name=name, path=file.name, upload=upload, member='', opener=_opener(file, upload.data))]
+
+
+def expand_uploads(files):
+    return [member for file in files or [] for member in expand_upload(file)]
@@ -1,10 +1,60 @@
 import base64
+import importlib
 import re
+import sys
+import threading
+import time
 from io import StringIO
 
+import numpy as np
 import pandas as pd
 import streamlit as st
-from serenipy.dtaselectfilter import from_dta_select_filter, results_to_df
+
+import config
+import jobs
+import peptide_index
+import shared_cache
+import uploads
+
+# seconds spent on the first import of each lazily imported module, shared by every session in the process.
+# only libraries that streamlit does not load itself are imported lazily
+IMPORT_TIMES = {}
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def lazy_import(name):
+    # import_module waits on the module lock, so a module still being imported by the warm-up thread is never
+    # returned half-initialized
+    loaded = name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    if not loaded:
+        IMPORT_TIMES.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def _import_warm_up_modules():
+    for name in config.WARM_UP_MODULES:
+        lazy_import(name)
+
+
+def warm_up():
+    global _warm_up_thread
+    if config.WARM_UP is not True:
+        return
+
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=_import_warm_up_modules, name='paser-warm-up', daemon=True)
+            _warm_up_thread.start()
+
+
+def timing_report():
+    with st.expander('Startup Timings'):
+        if _warm_up_thread is not None:
+            st.caption('Warm-up: ' + ('running' if _warm_up_thread.is_alive() else 'done'))
+        st.table([{'module': name, 'seconds': round(seconds, 3)} for name, seconds in IMPORT_TIMES.items()])
 
 
 def create_download_link(val, filename):
@@ -12,7 +62,8 @@ def create_download_link(val, filename):
     return f'<a href="data:application/octet-stream;base64,{b64.decode()}" download="{filename}">Download {filename}</a>'
 
 
-def peptide_config(disable_charge=False, disable_mod=False, disable_group=False) -> (bool, bool, bool):
+def peptide_config(disable_charge=False, disable_mod=False, disable_group=False,
+                   disable_stable_keys=False) -> (bool, bool, bool, bool):
     use_charge = st.checkbox(label='Group by peptide charge',
                              help='If False: (PEPTIDE +2 & PEPTIDE +3) == 1 unique peptides, '
                                   'If True:  (PEPTIDE +2 & PEPTIDE +3) == 2 unique peptides',
@@ -28,8 +79,14 @@ def peptide_config(disable_charge=False, disable_mod=False, disable_group=False)
                                   'If True: will count only the totla number of protein groups',
                              value=True,
                              disabled=disable_group)
+    use_stable_keys = st.checkbox(label='Use stable keys',
+                                  help='If False: keys are assigned in order of appearance and change between runs, '
+                                       'If True: keys are 64-bit hashes of the peptide/protein and are the same '
+                                       'in every run',
+                                  value=False,
+                                  disabled=disable_stable_keys)
 
-    return use_charge, use_modifications, use_groups
+    return use_charge, use_modifications, use_groups, use_stable_keys
 
 
 def get_unmodified_peptide(peptide_sequence: str) -> str:
@@ -37,6 +94,17 @@ def get_unmodified_peptide(peptide_sequence: str) -> str:
     return pattern.sub('', peptide_sequence)
 
 
+def get_uploaded_files(label='DTASelect-filter.txt files'):
+    # .gz, .bz2 and .zip uploads are expanded into the filter files they hold. uploads are expanded once and kept
+    # in st.session_state by upload id, so reruns keep the digests of members that were already parsed
+    files = st.file_uploader(label=label, accept_multiple_files=True, type=config.UPLOAD_TYPES) or []
+
+    expanded = st.session_state.get('expanded_uploads', {})
+    expanded = {file.id: expanded[file.id] if file.id in expanded else uploads.expand_upload(file) for file in files}
+    st.session_state['expanded_uploads'] = expanded
+    return [member for file in files for member in expanded[file.id]]
+
+
 def get_file_order_and_labels(files):
     names = []
     for i, file in enumerate(files):
@@ -54,14 +122,14 @@ def get_file_order_and_labels(files):
     labels = []
     orders = []
     for i, (file, name) in enumerate(zip(files, names)):
-        st.caption(file.name)
+        st.caption(file.path)
         c1, c2 = st.columns(2)
         # check if all chars in nam are digits
         if name.isnumeric():
-            num = c1.number_input(label='Order', value=int(name), key=f'num{file.name}')
+            num = c1.number_input(label='Order', value=int(name), key=f'num{file.path}')
         else:
-            num = c1.number_input(label='Order', value=i + 1, key=f'num{file.name}')
-        lab = c2.text_input(label='Label', value=name, key=f'lab{file.name}')
+            num = c1.number_input(label='Order', value=i + 1, key=f'num{file.path}')
+        lab = c2.text_input(label='Label', value=name, key=f'lab{file.path}')
 
         orders.append(num)
         labels.append(lab)
@@ -69,33 +137,250 @@ def get_file_order_and_labels(files):
     return orders, labels
 
 
-def get_peptides_and_protein_df(results):
-    dfs = []
-    for i, result in enumerate(results):
-        tmp_df = results_to_df(result)
-        tmp_df['file_num'] = i
-        dfs.append(tmp_df)
+def _parse_file(file_io):
+    dtaselectfilter = lazy_import('serenipy.dtaselectfilter')
 
-    df = pd.concat(dfs)
+    version, header, results, tailer = dtaselectfilter.from_dta_select_filter(file_io)
+    df = dtaselectfilter.results_to_df(results)
     df['clean_sequence'] = df['sequence'].apply(lambda x: x[2:-2])
     df['unmod_sequence'] = df['clean_sequence'].apply(lambda x: get_unmodified_peptide(x))
-    return df
+    return {'version': version, 'header': header, 'df': df, 'index': peptide_index.build_index(df), 'tailer': tailer}
 
 
-def add_protein_groups(df, use_groups):
-    seen = {}
-    protein_keys = []
-    for grp in df['protein_group' if use_groups is True else 'locus_name']:
-        protein_keys.append(seen.setdefault(grp, len(seen)))
-    df['protein_key'] = protein_keys
+def _parsed_file_size(parsed_file):
+    lines = list(parsed_file['header']) + list(parsed_file['tailer'])
+    index_size = sum(array.nbytes for field_index in parsed_file['index'].values() for array in field_index.values())
+    return int(parsed_file['df'].memory_usage(deep=True).sum()) + index_size + sum(len(str(line)) for line in lines)
+
+
+def parse_file(file):
+    # parsed files are shared between sessions, so the returned frame must not be modified in place. they are keyed
+    # by the sha256 of their uncompressed content, which is hashed while the file is parsed; the upload key of the
+    # file records that digest, so later uploads of the same bytes are served from the cache without being read
+    parsed = {}
+
+    def read_digest():
+        parsed['file'], digest = file.read_hashed(_parse_file)
+        return digest
+
+    file.digest = shared_cache.CACHE.get_or_compute(('upload', file.upload_key), read_digest, len, name=file.path)
+    if 'file' in parsed:
+        # the same content uploaded in another form may already be cached, that copy is shared instead
+        return shared_cache.CACHE.get_or_compute(file.digest, lambda: parsed['file'], _parsed_file_size,
+                                                 name=file.path)
+    return shared_cache.CACHE.get_or_compute(file.digest, lambda: file.read_hashed(_parse_file)[0],
+                                             _parsed_file_size, name=file.path)
 
 
-def add_peptide_groups(df, use_charge, use_modifications):
+def get_peptide_columns(use_charge, use_modifications):
+    column = 'sequence' if use_modifications is True else 'unmod_sequence'
+    return [column, 'charge'] if use_charge is True else [column]
+
+
+def get_protein_columns(use_groups):
+    return ['protein_group' if use_groups is True else 'locus_name']
+
+
+def get_key_map(df, columns, keys):
+    # distinct (values, key) pairs; a key paired with more than one value is a hash collision
+    return df[columns].assign(key=keys).drop_duplicates()
+
+
+def check_key_map(key_map, columns):
+    if key_map['key'].duplicated().any():
+        raise ValueError(f'Hash collision detected while keying {columns}!')
+
+
+def get_hashed_keys(df, columns):
+    # 64-bit row hashes are the same in every run, so keys from separately keyed frames can be combined.
+    # keys are viewed as int64 so they survive being stacked with the other int64 columns
+    return pd.util.hash_pandas_object(df[columns], index=False).values.view('int64')
+
+
+def _hashed_file_keys(df, columns):
+    keys = get_hashed_keys(df, columns)
+    return {'keys': keys, 'key_map': get_key_map(df, columns, keys)}
+
+
+def _hashed_file_keys_size(file_keys):
+    return int(file_keys['keys'].nbytes + file_keys['key_map'].memory_usage(deep=True).sum())
+
+
+def _get_shared_file_keys(file, parsed_file, columns):
+    return shared_cache.CACHE.get_or_compute((file.digest, tuple(columns)),
+                                             lambda: _hashed_file_keys(parsed_file['df'], columns),
+                                             _hashed_file_keys_size,
+                                             name=f'{file.path} [{", ".join(columns)}]')
+
+
+def get_file_keys(files, parsed_files, columns, use_stable_keys=False):
+    # one int64 key array per file, equal values get equal keys in every file
+    if use_stable_keys is True:
+        # stable keys are computed once per file and shared between sessions; the collision check runs on the
+        # union of the per-file key maps so it covers every file in the comparison
+        file_keys = []
+        for file, parsed_file in zip(files, parsed_files):
+            jobs.checkpoint()
+            file_keys.append(_get_shared_file_keys(file, parsed_file, columns))
+        check_key_map(pd.concat([keys['key_map'] for keys in file_keys]).drop_duplicates(), columns)
+        return [keys['keys'] for keys in file_keys]
+
     seen = {}
-    peptide_keys = []
-    for peptide, charge in df[['sequence' if use_modifications is True else 'unmod_sequence', 'charge']].values:
-        if use_charge is True:
-            peptide_keys.append(seen.setdefault((peptide, charge), len(seen)))
-        else:
-            peptide_keys.append(seen.setdefault(peptide, len(seen)))
-    df['peptide_key'] = peptide_keys
+    keys = []
+    for parsed_file in parsed_files:
+        jobs.checkpoint()
+        values = zip(*(parsed_file['df'][column] for column in columns))
+        keys.append(np.array([seen.setdefault(value, len(seen)) for value in values], dtype='int64'))
+    return keys
+
+
+def get_keyed_frame(parsed_files, peptide_keys, protein_keys, file_num, rows=slice(None)):
+    # rows are selected before the key columns are added, so only the selected rows are copied
+    return parsed_files[file_num]['df'].iloc[rows].assign(file_num=file_num,
+                                                          protein_key=protein_keys[file_num][rows],
+                                                          peptide_key=peptide_keys[file_num][rows])
+
+
+def get_combined_csv(parsed_files, peptide_keys, protein_keys):
+    # written file by file so the combined frame is never built
+    csv = StringIO()
+    for file_num in range(len(parsed_files)):
+        jobs.checkpoint()
+        get_keyed_frame(parsed_files, peptide_keys, protein_keys, file_num).to_csv(csv, index=False,
+                                                                                   header=file_num == 0)
+    return csv.getvalue().encode('UTF-8')
+
+
+def get_combined_head(parsed_files, peptide_keys, protein_keys, rows=config.PREVIEW_ROWS):
+    frames = []
+    for file_num in range(len(parsed_files)):
+        if rows <= 0:
+            break
+        frames.append(get_keyed_frame(parsed_files, peptide_keys, protein_keys, file_num, slice(rows)))
+        rows -= len(frames[-1])
+    return pd.concat(frames)
+
+
+def add_combined_outputs(result):
+    # built once in the job's outputs stage, so reruns only re-send the preview and the finished link
+    combined_csv = get_combined_csv(result['parsed_files'], result['peptide_keys'], result['protein_keys'])
+    result['combined_link'] = create_download_link(combined_csv, 'combined.csv')
+    result['combined_head'] = get_combined_head(result['parsed_files'], result['peptide_keys'], result['protein_keys'])
+    result['combined_rows'] = sum(len(parsed_file['df']) for parsed_file in result['parsed_files'])
+
+
+def show_preview(head, rows, hint='download the csv for all of them'):
+    # large frames are shown cut to their first rows, the caption tells users where to find the rest
+    st.dataframe(head)
+    if len(head) < rows:
+        st.caption(f'Showing first {len(head)} of {rows} rows, {hint}.')
+
+
+def pipeline_stages(use_charge, use_modifications, use_groups, use_stable_keys):
+    # stages shared by every page, run in a background job after the files are parsed
+
+    def key(data):
+        data['peptide_keys'] = get_file_keys(data['files'], data['parsed_files'],
+                                             get_peptide_columns(use_charge, use_modifications), use_stable_keys)
+        data['protein_keys'] = get_file_keys(data['files'], data['parsed_files'],
+                                             get_protein_columns(use_groups), use_stable_keys)
+
+    return [('key', key)]
+
+
+def start_job(job_key, files, labels, stages, parse=parse_file):
+    # parse runs on every file in the job's workers, pages that don't compare keyed frames may pass their own
+    if job_key in st.session_state:
+        st.session_state[job_key].cancel()
+    st.session_state[job_key] = jobs.Job(files, stages, {'files': files, 'labels': labels}, parse)
+
+
+def get_parsed_summary(parsed_file):
+    # counts shown for each parsed file while a job is still running
+    if 'df' in parsed_file:
+        return {'peptides': len(parsed_file['df']), 'proteins': parsed_file['df']['locus_name'].nunique()}
+    return {'peptides': parsed_file['peptides'], 'proteins': parsed_file['proteins']}
+
+
+def get_job_result(job_key):
+    # shows progress until the job in st.session_state[job_key] is done, then returns its data
+    job = st.session_state.get(job_key)
+    if job is None:
+        return None
+
+    if job.state == 'done':
+        return job.data
+
+    if job.state == 'failed':
+        del st.session_state[job_key]
+        st.error(f'Run failed: {job.error}')
+        return None
+
+    if st.button('Cancel', key=f'{job_key}_cancel'):
+        job.cancel()
+        del st.session_state[job_key]
+        st.info('Run cancelled!')
+        return None
+
+    st.caption(f'Parsed {job.files_done}/{len(job.files)} files')
+    st.progress(job.files_done / max(len(job.files), 1))
+    st.caption(f'Stage {min(job.stages_done + 1, len(job.stages))}/{len(job.stages)}: {job.stage}')
+    st.progress(job.stages_done / len(job.stages))
+
+    partial = [{'file': job.files[i].path, **get_parsed_summary(parsed_file)}
+               for i, parsed_file in enumerate(list(job.parsed_files)) if parsed_file is not None]
+    if partial:
+        st.table(partial)
+
+    time.sleep(0.5)
+    st.experimental_rerun()
+
+
+def store_search_index(parsed_files, labels):
+    st.session_state['peptide_search'] = {'parsed_files': parsed_files, 'labels': labels}
+
+
+def peptide_search():
+    if 'peptide_search' not in st.session_state:
+        return
+
+    parsed_files = st.session_state['peptide_search']['parsed_files']
+    labels = st.session_state['peptide_search']['labels']
+
+    st.markdown('---')
+    st.subheader('Search')
+    c1, c2, c3 = st.columns([3, 1, 1])
+    query = c1.text_input(label='Search loaded experiments', key='peptide_search_query')
+    field = c2.selectbox(label='Field', options=list(peptide_index.INDEX_FIELDS), key='peptide_search_field')
+    mode = c3.selectbox(label='Match', options=peptide_index.SEARCH_MODES, key='peptide_search_mode')
+
+    if not query:
+        return
+
+    matches, total = peptide_index.search([parsed_file['index'] for parsed_file in parsed_files], field, query, mode)
+    if not matches:
+        st.caption(f'No matches for {query}')
+        return
+    if len(matches) < total:
+        st.caption(f'Showing first {len(matches)} of {total} matching values, refine the search to see the rest.')
+
+    def protein_groups(file_rows):
+        return np.concatenate([parsed_files[file_num]['df']['protein_group'].values[rows]
+                               for file_num, rows in file_rows])
+
+    st.dataframe(pd.DataFrame([{field: value,
+                                'rows': sum(len(rows) for _, rows in file_rows),
+                                'experiments': ', '.join(labels[file_num] for file_num, _ in file_rows),
+                                'protein_groups': ', '.join(str(grp) for grp in pd.unique(protein_groups(file_rows)))}
+                               for value, file_rows in matches]))
+
+    with st.expander('Matching rows'):
+        # like the other previews only the first rows are copied out of the parsed files
+        frames, rows_left = [], config.PREVIEW_ROWS
+        for _, file_rows in matches:
+            for file_num, rows in file_rows:
+                if rows_left > 0:
+                    frames.append(parsed_files[file_num]['df'].iloc[rows[:rows_left]].assign(file_num=file_num))
+                    rows_left -= len(frames[-1])
+        show_preview(pd.concat(frames), sum(len(rows) for _, file_rows in matches for _, rows in file_rows),
+                     hint='refine the search to see the rest')